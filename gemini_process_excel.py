@@ -1,11 +1,8 @@
 from langchain_oci import (
     ChatOCIGenAI,
-    load_image,
-    encode_image,
     is_vision_model,
 )
-from langchain_core.messages import HumanMessage,SystemMessage
-import requests
+from langchain_core.messages import HumanMessage
 import pandas as pd
 
 # Vision-capable model
@@ -22,18 +19,33 @@ llm = ChatOCIGenAI(
     service_endpoint="https://inference.generativeai.us-chicago-1.oci.oraclecloud.com",
 )
 
-df = pd.read_excel("demodata.xlsx",sheet_name="GiftRecords")
+# Only the columns the analysis needs; IDs and other fields just cost tokens
+COLUMNS = ["City", "College", "Allocation Subcategory", "Gift Amount", "Gift Date"]
+
+# Generated once from demodata.xlsx by xlsx2parquet.py
+df = pd.read_parquet("demodata.parquet", columns=COLUMNS)
+df = df.astype({"Gift Date": "datetime64[s]"})
 
 # ----------------------------
-# Load Data
+# Aggregate Data
 # ----------------------------
-table_data = df.to_markdown()
+# Totals are computed in pandas so the LLM only sees the small summary tables
+city_college = df.groupby(["City", "College"])["Gift Amount"].sum().reset_index()
+top5 = df.groupby("Allocation Subcategory")["Gift Amount"].sum().nlargest(5).reset_index()
+sample = df.sample(n=min(len(df), 50), random_state=0)
+
 user_query=f"""
-You are a data analyst. I will give you a small sample of an Excel export
-as CSV text. Each row has Allocation Subcategory,City,College,Gift Allocation,Gift Amount,Gift Date,Major,Prospect ID,State
+You are a data analyst. I will give you summaries of an Excel export
+as CSV text. The raw rows have {",".join(COLUMNS)}
+
+Total gift amount by City, College:
+{city_college.to_csv(index=False)}
 
-Data:
-{table_data}
+Top 5 Allocation Subcategories by total gift amount:
+{top5.to_csv(index=False)}
+
+Random sample of {len(sample)} raw rows:
+{sample.to_csv(index=False)}
 
 Tasks:
 1) Summarize total gift received by City, College
@@ -46,6 +58,11 @@ message = [
 HumanMessage(user_query)
 ]
 
-result = llm.invoke(message)
-print(result.content)
+# ----------------------------
+# Streaming invocation
+# ----------------------------
+for chunk in llm.stream(message):
+    if chunk.content:
+        print(chunk.content, end="", flush=True)
+print()
 
@@ -5,15 +5,17 @@ This agent can extract two numbers from natural language input and return their
 
 import os
 import re
+import asyncio
+import functools
+import inspect
+import itertools
 import logging
+import threading
 from typing import Dict, List, Optional, Tuple, Any
 from dataclasses import dataclass
 
 from langchain_core.messages import HumanMessage, AIMessage, BaseMessage
-from langchain_core.runnables import RunnableConfig
-#from langchain_oci import ChatOCIGenerativeAI
-from langchain_oci.chat_models.oci_generative_ai import ChatOCIGenAI
-from langchain_oci.common.auth import OCIAuthType
+from langchain_core.runnables import RunnableConfig, RunnableLambda
 from langgraph.graph import StateGraph, END
 from langgraph.graph.message import add_messages
 from langgraph.checkpoint.memory import MemorySaver
@@ -27,6 +29,99 @@ logger = logging.getLogger(__name__)
 from dotenv import load_dotenv
 load_dotenv()
 
+# Matches signed integers, decimals and scientific notation, e.g. "5", "-10.5", "1e3"
+_NUM_RE = re.compile(r'[-+]?\d*\.?\d+(?:[eE][-+]?\d+)?')
+_QUIT_RE = re.compile(r'^\s*(quit|exit|bye)\s*$', re.I)
+# Requests for a worked explanation, which still go to the LLM
+_VERBOSE_RE = re.compile(r'\b(explain|explanation|why|how (?:did|do|does) (?:you|it|that)|show (?:your |the )?work|step[- ]by[- ]step)\b', re.I)
+
+# Deterministic replies for the common case, used round-robin
+_RESPONSE_TEMPLATES = [
+    "The sum of {a} and {b} is {s}.",
+    "{a} + {b} = {s} 🎉",
+    "Adding {a} and {b} gives {s}.",
+    "{a} plus {b} equals {s}.",
+]
+_RESPONSE_TEMPLATE_CYCLE = itertools.cycle(_RESPONSE_TEMPLATES)
+
+# One ChatOCIGenAI client per model, shared by all agents so OCI auth and
+# HTTP connection setup happen only once per process
+_LLM_CACHE: Dict[str, Any] = {}
+_LLM_CACHE_LOCK = threading.Lock()
+_RESPONSE_CACHE_CONFIGURED = False
+
+def _configure_response_cache() -> None:
+    """Memoize LLM responses on disk so repeated prompts skip the round-trip,
+    including across process restarts. Runs once; the caller holds _LLM_CACHE_LOCK."""
+    global _RESPONSE_CACHE_CONFIGURED
+    if _RESPONSE_CACHE_CONFIGURED:
+        return
+    from langchain_core.globals import set_llm_cache
+    from langchain_community.cache import SQLiteCache
+    set_llm_cache(SQLiteCache(database_path=os.getenv("LLM_CACHE_PATH", ".llm_cache.db")))
+    _RESPONSE_CACHE_CONFIGURED = True
+
+def _get_llm(model_name: str) -> Any:
+    """Return the shared ChatOCIGenAI client for a model, creating it on first use"""
+    with _LLM_CACHE_LOCK:
+        llm = _LLM_CACHE.get(model_name)
+        if llm is None:
+            _configure_response_cache()
+            # Imported here: langchain_oci pulls in the OCI SDK, which dominates startup time
+            #from langchain_oci import ChatOCIGenerativeAI
+            from langchain_oci.chat_models.oci_generative_ai import ChatOCIGenAI
+            
+            llm = ChatOCIGenAI(
+                model_id=model_name,
+                compartment_id="ocid1.compartment.oc1..aaaaaaaamjxynn55q2nddbeur3zwnkzis4yogjtqkd6zzyoaxxx",
+                #temperature=0,
+                #service_endpoint=os.getenv("OCI_SERVICE_ENDPOINT"),
+                #auth_type=os.getenv("OCI_AUTH_TYPE", "API_KEY"),
+                #auth_profile=os.getenv("OCI_AUTH_PROFILE", "DEFAULT"),
+                auth_type=os.getenv("OCI_AUTH_TYPE", "INSTANCE_PRINCIPAL"),
+            )
+            _LLM_CACHE[model_name] = llm
+        return llm
+
+def _sum_pair(a: float, b: float) -> float:
+    """Pure numeric kernel for the agent's calculation.
+
+    Kept as plain Python: a scalar add runs well under a microsecond, where
+    Numba's dispatch overhead would make a jitted version slower.
+    """
+    return a + b
+
+def _node_errors(action: str, **failed_state: Any):
+    """Decorator for graph nodes: log any exception and record it in the state.
+
+    ``action`` completes the message "Error <action>: ..."; ``failed_state``
+    holds the state fields to reset when the node fails.
+    """
+    def decorator(fn):
+        def record(state, e):
+            logger.error(f"Error {action}: {str(e)}")
+            state["error_message"] = f"Error {action}: {str(e)}"
+            state.update(failed_state)
+            return state
+        
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(self, state):
+                try:
+                    return await fn(self, state)
+                except Exception as e:
+                    return record(state, e)
+            return async_wrapper
+        
+        @functools.wraps(fn)
+        def wrapper(self, state):
+            try:
+                return fn(self, state)
+            except Exception as e:
+                return record(state, e)
+        return wrapper
+    return decorator
+
 class AgentState(TypedDict):
     """State for the number summation agent"""
     messages: Annotated[List[BaseMessage], add_messages]
@@ -45,19 +140,11 @@ class NumberExtractionResult:
 class NumberSumAgent:
     """AI Agent for summing two numbers using LangGraph"""
 
-    print("val Service Endpoint\t",os.getenv("OCI_SERVICE_ENDPOINT"))
-    print("val API  Key\t",os.getenv("API_KEY") [::-1])
     def __init__(self, model_name: str = "openai.gpt-oss-120b"):
         """Initialize the agent with OCI Generative AI model"""
-        self.llm = ChatOCIGenAI(
-            model_id=model_name,
-            compartment_id="ocid1.compartment.oc1..aaaaaaaamjxynn55q2nddbeur3zwnkzis4yogjtqkd6zzyoaxxx",
-            #temperature=0,
-            #service_endpoint=os.getenv("OCI_SERVICE_ENDPOINT"),
-            #auth_type=os.getenv("OCI_AUTH_TYPE", "API_KEY"),
-            #auth_profile=os.getenv("OCI_AUTH_PROFILE", "DEFAULT"),
-            auth_type=os.getenv("OCI_AUTH_TYPE", "INSTANCE_PRINCIPAL"),
-        )
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Service endpoint: {os.getenv('OCI_SERVICE_ENDPOINT')}")
+        self.llm = _get_llm(model_name)
         self.graph = self._build_graph()
         self.memory = MemorySaver()
         
@@ -66,9 +153,14 @@ class NumberSumAgent:
         workflow = StateGraph(AgentState)
         
         # Add nodes
-        workflow.add_node("extract_numbers", self._extract_numbers)
-        workflow.add_node("calculate_sum", self._calculate_sum)
-        workflow.add_node("generate_response", self._generate_response)
+        workflow.add_node(
+            "extract_numbers",
+            RunnableLambda(self._extract_numbers, afunc=self._aextract_numbers)
+        )
+        workflow.add_node(
+            "finalize",
+            RunnableLambda(self._finalize, afunc=self._afinalize)
+        )
         workflow.add_node("handle_error", self._handle_error)
         
         # Add edges
@@ -77,26 +169,18 @@ class NumberSumAgent:
             "extract_numbers",
             self._should_calculate_or_error,
             {
-                "calculate": "calculate_sum",
+                "calculate": "finalize",
                 "error": "handle_error"
             }
         )
-        workflow.add_edge("calculate_sum", "generate_response")
-        workflow.add_edge("generate_response", END)
+        workflow.add_edge("finalize", END)
         workflow.add_edge("handle_error", END)
         
         return workflow.compile()
     
-    def _extract_numbers(self, state: AgentState) -> AgentState:
-        """Extract two numbers from the user's message"""
-        try:
-            last_message = state["messages"][-1]
-            user_input = last_message.content
-            
-            logger.info(f"Extracting numbers from: {user_input}")
-            
-            # Use LLM to extract numbers more robustly
-            extraction_prompt = f"""
+    def _build_extraction_prompt(self, user_input: str) -> str:
+        """Build the LLM prompt used when the regex fast path cannot extract the numbers"""
+        return f"""
             Extract exactly two numbers from the following text and return them as a comma-separated list.
             If you cannot find exactly two numbers, respond with "ERROR: <reason>".
             
@@ -108,83 +192,153 @@ class NumberSumAgent:
             "Calculate the sum of 7 and 8" -> "7,8"
             "I want to add twenty and thirty" -> "ERROR: Cannot extract numbers"
             """
-            
-            response = self.llm.invoke(extraction_prompt)
-            extraction_result = response.content.strip()
-            
-            if extraction_result.startswith("ERROR:"):
-                state["error_message"] = extraction_result
-                state["extracted_numbers"] = None
-                logger.warning(f"Extraction failed: {extraction_result}")
-            else:
-                # Parse the extracted numbers
-                try:
-                    numbers_str = extraction_result.split(',')
-                    if len(numbers_str) == 2:
-                        num1 = float(numbers_str[0].strip())
-                        num2 = float(numbers_str[1].strip())
-                        state["extracted_numbers"] = (num1, num2)
-                        logger.info(f"Successfully extracted numbers: {num1}, {num2}")
-                    else:
-                        state["error_message"] = "Could not extract exactly two numbers"
-                        state["extracted_numbers"] = None
-                except ValueError as e:
-                    state["error_message"] = f"Invalid number format: {str(e)}"
-                    state["extracted_numbers"] = None
-            
-        except Exception as e:
-            logger.error(f"Error in number extraction: {str(e)}")
-            state["error_message"] = f"Error extracting numbers: {str(e)}"
+    
+    def _apply_extraction_result(self, state: AgentState, extraction_result: str) -> AgentState:
+        """Parse the LLM extraction output into the agent state"""
+        if extraction_result.startswith("ERROR:"):
+            state["error_message"] = extraction_result
             state["extracted_numbers"] = None
+            logger.warning(f"Extraction failed: {extraction_result}")
+        else:
+            # Parse the extracted numbers
+            try:
+                numbers_str = extraction_result.split(',')
+                if len(numbers_str) == 2:
+                    num1 = float(numbers_str[0].strip())
+                    num2 = float(numbers_str[1].strip())
+                    state["extracted_numbers"] = (num1, num2)
+                    logger.info(f"Successfully extracted numbers: {num1}, {num2}")
+                else:
+                    state["error_message"] = "Could not extract exactly two numbers"
+                    state["extracted_numbers"] = None
+            except ValueError as e:
+                state["error_message"] = f"Invalid number format: {str(e)}"
+                state["extracted_numbers"] = None
         
         return state
     
-    def _calculate_sum(self, state: AgentState) -> AgentState:
-        """Calculate the sum of extracted numbers"""
-        try:
-            numbers = state["extracted_numbers"]
-            if numbers and len(numbers) == 2:
-                num1, num2 = numbers
-                sum_result = num1 + num2
-                state["sum_result"] = sum_result
-                state["calculation_complete"] = True
-                logger.info(f"Calculated sum: {num1} + {num2} = {sum_result}")
-            else:
-                state["error_message"] = "No valid numbers available for calculation"
-                state["calculation_complete"] = False
-                
-        except Exception as e:
-            logger.error(f"Error in calculation: {str(e)}")
-            state["error_message"] = f"Error calculating sum: {str(e)}"
-            state["calculation_complete"] = False
+    def _extract_numbers_fast(self, state: AgentState, user_input: str) -> bool:
+        """Regex fast path: plain numeric input needs no LLM round-trip"""
+        nums = _NUM_RE.findall(user_input)
+        if len(nums) == 2:
+            state["extracted_numbers"] = (float(nums[0]), float(nums[1]))
+            logger.info(f"Extracted numbers without LLM: {nums[0]}, {nums[1]}")
+            return True
+        return False
+    
+    @_node_errors("extracting numbers", extracted_numbers=None)
+    def _extract_numbers(self, state: AgentState) -> AgentState:
+        """Extract two numbers from the user's message"""
+        # Already resolved up front, e.g. by the batched LLM call in chat_batch
+        if state.get("extracted_numbers") or state.get("error_message"):
+            return state
+        
+        last_message = state["messages"][-1]
+        user_input = last_message.content
+        
+        logger.info(f"Extracting numbers from: {user_input}")
+        
+        if self._extract_numbers_fast(state, user_input):
+            return state
+        
+        # Fall back to the LLM to extract numbers more robustly
+        response = self.llm.invoke(self._build_extraction_prompt(user_input))
+        return self._apply_extraction_result(state, response.content.strip())
+    
+    @_node_errors("extracting numbers", extracted_numbers=None)
+    async def _aextract_numbers(self, state: AgentState) -> AgentState:
+        """Async variant of _extract_numbers that awaits the LLM fallback"""
+        if state.get("extracted_numbers") or state.get("error_message"):
+            return state
+        
+        last_message = state["messages"][-1]
+        user_input = last_message.content
+        
+        logger.info(f"Extracting numbers from: {user_input}")
+        
+        if self._extract_numbers_fast(state, user_input):
+            return state
+        
+        response = await self.llm.ainvoke(self._build_extraction_prompt(user_input))
+        return self._apply_extraction_result(state, response.content.strip())
+    
+    def _compute_sum(self, state: AgentState) -> Optional[Tuple[float, float, float]]:
+        """Record the sum of the extracted numbers in the state, or the error if there are none"""
+        numbers = state["extracted_numbers"]
+        if numbers and len(numbers) == 2:
+            num1, num2 = numbers
+            sum_result = _sum_pair(num1, num2)
+            state["sum_result"] = sum_result
+            state["calculation_complete"] = True
+            logger.info(f"Calculated sum: {num1} + {num2} = {sum_result}")
+            return num1, num2, sum_result
+        
+        state["error_message"] = "No valid numbers available for calculation"
+        state["calculation_complete"] = False
+        return None
+    
+    @_node_errors("calculating sum", calculation_complete=False)
+    def _finalize(self, state: AgentState) -> AgentState:
+        """Calculate the sum of extracted numbers and generate the response"""
+        calculation = self._compute_sum(state)
+        if calculation:
+            ai_message = AIMessage(content=self._generate_response(state, *calculation))
+            state["messages"].append(ai_message)
         
         return state
     
-    def _generate_response(self, state: AgentState) -> AgentState:
-        """Generate a natural language response"""
-        try:
-            numbers = state["extracted_numbers"]
-            sum_result = state["sum_result"]
-            
-            response_prompt = f"""
+    @_node_errors("calculating sum", calculation_complete=False)
+    async def _afinalize(self, state: AgentState) -> AgentState:
+        """Async variant of _finalize that awaits the LLM explanation"""
+        calculation = self._compute_sum(state)
+        if calculation:
+            ai_message = AIMessage(content=await self._agenerate_response(state, *calculation))
+            state["messages"].append(ai_message)
+        
+        return state
+    
+    def _build_response_prompt(self, num1: float, num2: float, sum_result: float) -> str:
+        """Build the prompt asking the LLM to explain a calculation"""
+        return f"""
             Create a friendly, conversational response for the following calculation:
-            Numbers: {numbers[0]} and {numbers[1]}
+            Numbers: {num1} and {num2}
             Sum: {sum_result}
             
             Make it sound natural and helpful. Show the calculation clearly.
             """
-            
-            response = self.llm.invoke(response_prompt)
-            ai_message = AIMessage(content=response.content)
-            state["messages"].append(ai_message)
+    
+    def _generate_response(self, state: AgentState, num1: float, num2: float, sum_result: float) -> str:
+        """Generate the reply, only calling the LLM when an explanation was asked for"""
+        templated_response = next(_RESPONSE_TEMPLATE_CYCLE).format(a=num1, b=num2, s=sum_result)
+        
+        user_input = state["messages"][-1].content
+        if not _VERBOSE_RE.search(user_input):
+            # The result is closed-form, so a templated reply replaces the LLM call
+            return templated_response
+        
+        try:
+            response = self.llm.invoke(self._build_response_prompt(num1, num2, sum_result))
+            return response.content
             
         except Exception as e:
             logger.error(f"Error generating response: {str(e)}")
-            fallback_response = f"The sum of {numbers[0]} and {numbers[1]} is {sum_result}."
-            ai_message = AIMessage(content=fallback_response)
-            state["messages"].append(ai_message)
+            return templated_response
+    
+    async def _agenerate_response(self, state: AgentState, num1: float, num2: float, sum_result: float) -> str:
+        """Async variant of _generate_response that awaits the LLM"""
+        templated_response = next(_RESPONSE_TEMPLATE_CYCLE).format(a=num1, b=num2, s=sum_result)
         
-        return state
+        user_input = state["messages"][-1].content
+        if not _VERBOSE_RE.search(user_input):
+            return templated_response
+        
+        try:
+            response = await self.llm.ainvoke(self._build_response_prompt(num1, num2, sum_result))
+            return response.content
+            
+        except Exception as e:
+            logger.error(f"Error generating response: {str(e)}")
+            return templated_response
     
     def _handle_error(self, state: AgentState) -> AgentState:
         """Handle errors and provide helpful error messages"""
@@ -213,33 +367,91 @@ class NumberSumAgent:
         else:
             return "error"
     
+    def _initial_state(self, message: str) -> AgentState:
+        """Create the initial graph state for a user message"""
+        return {
+            "messages": [HumanMessage(content=message)],
+            "extracted_numbers": None,
+            "sum_result": None,
+            "error_message": None,
+            "calculation_complete": False
+        }
+    
+    def _last_ai_response(self, result: AgentState) -> str:
+        """Return the content of the most recent AI message in a graph result"""
+        # Scan from the end: the AI reply is normally the last message
+        for msg in reversed(result["messages"]):
+            if isinstance(msg, AIMessage):
+                return msg.content
+        return "I'm sorry, I couldn't generate a response."
+    
     def chat(self, message: str, thread_id: str = "default") -> str:
         """Main chat interface"""
         try:
             # Create initial state
-            initial_state = {
-                "messages": [HumanMessage(content=message)],
-                "extracted_numbers": None,
-                "sum_result": None,
-                "error_message": None,
-                "calculation_complete": False
-            }
+            initial_state = self._initial_state(message)
             
             # Run the graph
             config = RunnableConfig(configurable={"thread_id": thread_id})
             result = self.graph.invoke(initial_state, config)
             
             # Return the last AI message
-            ai_messages = [msg for msg in result["messages"] if isinstance(msg, AIMessage)]
-            if ai_messages:
-                return ai_messages[-1].content
-            else:
-                return "I'm sorry, I couldn't generate a response."
+            return self._last_ai_response(result)
                 
         except Exception as e:
             logger.error(f"Error in chat: {str(e)}")
             return f"An error occurred: {str(e)}"
     
+    async def chat_async(self, message: str, thread_id: str = "default") -> str:
+        """Async chat interface; lets callers overlap many conversations with asyncio.gather"""
+        try:
+            initial_state = self._initial_state(message)
+            
+            # Run the graph without blocking the event loop
+            config = RunnableConfig(configurable={"thread_id": thread_id})
+            result = await self.graph.ainvoke(initial_state, config)
+            
+            # Return the last AI message
+            return self._last_ai_response(result)
+                
+        except Exception as e:
+            logger.error(f"Error in chat_async: {str(e)}")
+            return f"An error occurred: {str(e)}"
+    
+    def chat_batch(self, messages: List[str], thread_ids: Optional[List[str]] = None) -> List[str]:
+        """Batch chat interface: pending LLM extractions run as one concurrent batch"""
+        try:
+            if thread_ids is None:
+                thread_ids = ["default"] * len(messages)
+            
+            initial_states = [self._initial_state(message) for message in messages]
+            
+            # Extract numbers for every message the regex fast path can't handle in one concurrent
+            # llm.batch() call (one invoke per prompt on a thread pool, not a single request)
+            pending = [i for i, message in enumerate(messages) if len(_NUM_RE.findall(message)) != 2]
+            if pending:
+                logger.info(f"Batch extracting numbers for {len(pending)} of {len(messages)} messages")
+                prompts = [self._build_extraction_prompt(messages[i]) for i in pending]
+                try:
+                    extractions = self.llm.batch(prompts)
+                    for i, extraction in zip(pending, extractions):
+                        self._apply_extraction_result(initial_states[i], extraction.content.strip())
+                except Exception as e:
+                    logger.error(f"Error in batch number extraction: {str(e)}")
+                    for i in pending:
+                        initial_states[i]["error_message"] = f"Error extracting numbers: {str(e)}"
+            
+            # Run the graph
+            configs = [RunnableConfig(configurable={"thread_id": thread_id}) for thread_id in thread_ids]
+            results = self.graph.batch(initial_states, configs)
+            
+            # Return the last AI message of each result
+            return [self._last_ai_response(result) for result in results]
+            
+        except Exception as e:
+            logger.error(f"Error in chat_batch: {str(e)}")
+            return [f"An error occurred: {str(e)}"] * len(messages)
+    
     def get_conversation_history(self, thread_id: str = "default") -> List[BaseMessage]:
         """Get conversation history for a thread"""
         try:
@@ -250,7 +462,28 @@ class NumberSumAgent:
             logger.error(f"Error getting conversation history: {str(e)}")
             return []
 
-def main():
+async def _ainput(prompt: str) -> str:
+    """Read a line from stdin without blocking the event loop.
+    
+    The read runs in a daemon thread rather than the default executor: on Ctrl-C
+    asyncio.run cancels the main task, and executor shutdown would then wait for
+    the worker still blocked in input().
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    
+    def read():
+        try:
+            line = input(prompt)
+        except BaseException as e:
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_exception(e))
+        else:
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(line))
+    
+    threading.Thread(target=read, daemon=True).start()
+    return await future
+
+async def main():
     """Main function to run the agent interactively"""
     print("🤖 Number Summation AI Agent")
     print("I can help you add two numbers! Just ask me something like:")
@@ -263,24 +496,25 @@ def main():
     
     while True:
         try:
-            user_input = input("You: ").strip()
+            user_input = (await _ainput("You: ")).strip()
             
-            if user_input.lower() in ['quit', 'exit', 'bye']:
+            if _QUIT_RE.match(user_input):
                 print("Goodbye! 👋")
                 break
             
             if not user_input:
                 continue
             
-            response = agent.chat(user_input)
+            response = await agent.chat_async(user_input)
             print(f"Agent: {response}")
             
-        except KeyboardInterrupt:
+        except (KeyboardInterrupt, asyncio.CancelledError):
+            # Under asyncio.run, Ctrl-C arrives as cancellation of this task
             print("\nGoodbye! 👋")
             break
         except Exception as e:
             print(f"Error: {str(e)}")
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
 
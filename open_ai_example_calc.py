@@ -9,18 +9,105 @@ import os
 import re
 import json
 import sys
+import time
 import asyncio
+import hashlib
 import logging
+import operator
+import threading
+from array import array
+import sqlite3
+from collections import OrderedDict, deque
 from datetime import datetime
-from typing import Dict, List, Tuple, Optional, Any
-from dataclasses import dataclass, asdict
+from typing import Dict, List, Tuple, Optional, Any, Union
+from dataclasses import dataclass
+from functools import cached_property, lru_cache
 from enum import Enum
+import numpy as np
+import orjson
+import tiktoken
 import colorama
 from colorama import Fore, Style
 from dotenv import load_dotenv
+import httpx
 import openai
-from openai import OpenAI
-from oci_openai import OciOpenAI, OciSessionAuth, OciInstancePrincipalAuth, OciUserPrincipalAuth, OciResourcePrincipalAuth
+from openai import AsyncOpenAI
+from oci_openai import AsyncOciOpenAI, OciSessionAuth, OciInstancePrincipalAuth, OciUserPrincipalAuth, OciResourcePrincipalAuth
+
+
+MODEL_ID = "openai.gpt-oss-120b"
+
+@lru_cache(maxsize=None)
+def _get_encoding() -> Optional["tiktoken.Encoding"]:
+    """The o200k vocabulary used by gpt-oss models, or None if it can't be loaded.
+    
+    tiktoken downloads the vocabulary on first use, which fails on hosts without
+    internet egress. The failure is cached like a success, so it is tried and
+    logged once and token counts fall back to an estimate.
+    """
+    try:
+        return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        logger.warning(f"Token counts will be estimated, could not load o200k_base: {e}")
+        return None
+
+# Kept byte-identical across requests so the provider can reuse its prefix cache
+SYSTEM_PROMPT = """You are a mathematical AI assistant specialized in arithmetic operations.
+When given a mathematical expression, you must:
+1. Show step-by-step reasoning
+2. Perform the calculation accurately
+3. Provide the final numerical result clearly
+4. Be concise but thorough in your explanation
+
+Format your response to include the reasoning process and end with a line "Final answer: <number>"."""
+# Shared by every request; never mutated
+_SYSTEM_MESSAGE = {"role": "system", "content": SYSTEM_PROMPT}
+
+# Regexes are compiled once here rather than on every call
+_NUMBER_RE = re.compile(r'-?\d+\.?\d*')
+
+# Operation words and the operator they map to
+_OP_MAP = {
+    'add': '+', 'plus': '+', 'sum': '+', 'addition': '+',
+    'subtract': '-', 'minus': '-', 'difference': '-',
+    'multiply': '*', 'times': '*', 'product': '*', 'multiplication': '*',
+    'divide': '/', 'divided by': '/', 'division': '/'
+}
+# One scan for the leftmost operation word. Only the start is word-bounded so
+# inflections such as "adding" or "multiplying" still match; longer words are
+# tried first so "addition" wins over "add".
+_OP_RE = re.compile(r'\b(' + '|'.join(sorted(map(re.escape, _OP_MAP), key=len, reverse=True)) + ')')
+
+# Canonical "a op b" form produced by parse_math_expression
+_BINARY_EXPR_RE = re.compile(r'^\s*(-?\d+\.?\d*)\s*([-+*/])\s*(-?\d+\.?\d*)\s*$')
+
+# Look for patterns like "result is X", "answer: X", etc., combined into one
+# alternation so the response is scanned once. Each alternative has exactly one
+# group, so match.lastindex is the pattern's priority (1 = highest). The
+# alternatives are zero-width lookaheads: a lower-priority match must not consume
+# text that a higher-priority pattern would match from a later position, e.g.
+# "final answer: 8" hiding "answer: 8".
+# Matched against lowercased text, hence no re.IGNORECASE.
+_RESULT_RE = re.compile('|'.join(f'(?=(?:{p}))' for p in [
+    r'(?:result|answer|equals?|is)\s*:?\s*(-?\d+\.?\d*)',
+    r'(-?\d+\.?\d*)\s*(?:is the result|is the answer)',
+    r'final answer\s*:?\s*(-?\d+\.?\d*)',
+    r'(-?\d+\.?\d*)$'  # Last number in response
+]))
+
+# An unambiguous, fully streamed final answer: the number must be followed by a
+# character that cannot continue it, so "12" is not taken from a partial "123"
+_FINAL_ANSWER_RE = re.compile(r'final answer\s*:?\s*(-?\d+(?:\.\d+)?)(?=[^\d.]|\.[^\d])', re.IGNORECASE)
+
+# Matched against lowercased text, hence no re.IGNORECASE
+_REASONING_PATTERNS = [re.compile(p) for p in [
+    r'(?:step|reasoning|explanation|because|since)[^:]*:\s*(.*?)(?:\n|$)',
+    r'(?:i think|i believe|i calculate)[^:]*:\s*(.*?)(?:\n|$)'
+]]
+
+# Standalone operator symbols; a minus only counts when space-separated,
+# otherwise it belongs to a negative number
+_OPERATOR_SYMBOL_RE = re.compile(r'[+*/]|(?<=\s)-(?=\s)')
 
 
 # Initialize colorama for colored output
@@ -48,13 +135,26 @@ class AgentState(Enum):
     ERROR = "error"
 
 
+def _ns_to_datetime(timestamp_ns: int) -> datetime:
+    """Convert a time.time_ns() value to a naive local datetime."""
+    # Integer split: ns / 1e9 as a float loses sub-microsecond precision and can round
+    # the microseconds differently from the stored value
+    seconds, nanos = divmod(timestamp_ns, 10**9)
+    return datetime.fromtimestamp(seconds).replace(microsecond=nanos // 1000)
+
+
 @dataclass
 class ConversationMessage:
     """Represents a conversation message."""
     role: str  # 'user' or 'assistant'
     content: str
-    timestamp: datetime
+    timestamp_ns: int  # time.time_ns(); see the timestamp property
     metadata: Optional[Dict[str, Any]] = None
+    
+    @cached_property
+    def timestamp(self) -> datetime:
+        """Message time as a datetime, built on first access."""
+        return _ns_to_datetime(self.timestamp_ns)
 
 
 @dataclass
@@ -65,8 +165,13 @@ class CalculationResult:
     reasoning: str
     confidence: float
     verification_passed: bool
-    timestamp: datetime
+    timestamp_ns: int  # time.time_ns(); see the timestamp property
     tokens_used: int
+    
+    @cached_property
+    def timestamp(self) -> datetime:
+        """Calculation time as a datetime, built on first access."""
+        return _ns_to_datetime(self.timestamp_ns)
 
 
 class ConversationManager:
@@ -74,29 +179,31 @@ class ConversationManager:
     
     def __init__(self, max_history: int = 10):
         self.max_history = max_history
-        self.messages: List[ConversationMessage] = []
+        # Oldest messages are evicted automatically once max_history is reached
+        self.messages: "deque[ConversationMessage]" = deque(maxlen=max_history)
         self.context_variables: Dict[str, Any] = {}
+        self._context: Optional[List[Dict[str, str]]] = None
     
     def add_message(self, role: str, content: str, metadata: Optional[Dict[str, Any]] = None):
         """Add a message to conversation history."""
         message = ConversationMessage(
             role=role,
             content=content,
-            timestamp=datetime.now(),
+            timestamp_ns=time.time_ns(),
             metadata=metadata
         )
         self.messages.append(message)
-        
-        # Trim history if needed
-        if len(self.messages) > self.max_history:
-            self.messages = self.messages[-self.max_history:]
+        self._context = None
     
     def get_context(self) -> List[Dict[str, str]]:
         """Get conversation context for API calls."""
-        return [
-            {"role": msg.role, "content": msg.content}
-            for msg in self.messages
-        ]
+        # Built once per change to the history; callers must not mutate it
+        if self._context is None:
+            self._context = [
+                {"role": msg.role, "content": msg.content}
+                for msg in self.messages
+            ]
+        return self._context
     
     def set_context_variable(self, key: str, value: Any):
         """Set a context variable."""
@@ -110,11 +217,17 @@ class ConversationManager:
 class MathematicalEngine:
     """Handles mathematical reasoning and verification."""
     
+    OPERATORS = {
+        '+': operator.add,
+        '-': operator.sub,
+        '*': operator.mul,
+        '/': operator.truediv,
+    }
+    
     @staticmethod
     def extract_numbers_from_text(text: str) -> List[float]:
         """Extract all numbers from text."""
-        pattern = r'-?\d+\.?\d*'
-        matches = re.findall(pattern, text)
+        matches = _NUMBER_RE.findall(text)
         return [float(match) for match in matches]
     
     @staticmethod
@@ -123,18 +236,8 @@ class MathematicalEngine:
         expression = expression.lower().strip()
         
         # Identify the operation
-        operations = {
-            'add': '+', 'plus': '+', 'sum': '+', 'addition': '+',
-            'subtract': '-', 'minus': '-', 'difference': '-',
-            'multiply': '*', 'times': '*', 'product': '*', 'multiplication': '*',
-            'divide': '/', 'divided by': '/', 'division': '/'
-        }
-        
-        operation = None
-        for word, op in operations.items():
-            if word in expression:
-                operation = op
-                break
+        match = _OP_RE.search(expression)
+        operation = _OP_MAP[match.group(1)] if match else None
         
         # Extract numbers
         numbers = MathematicalEngine.extract_numbers_from_text(expression)
@@ -146,9 +249,22 @@ class MathematicalEngine:
         
         return expression, numbers
     
+    @staticmethod
+    def calculate(operation: str, a: float, b: float) -> Optional[float]:
+        """Apply a binary operation; returns None for division by zero."""
+        if operation == '/' and b == 0:
+            return None
+        return MathematicalEngine.OPERATORS[operation](a, b)
+    
     @staticmethod
     def calculate_locally(expression: str) -> Optional[float]:
         """Calculate expression locally for verification."""
+        # Fast path: one regex pass over the canonical "a op b" form, which
+        # also handles negative operands such as "5.0 * -3.0"
+        match = _BINARY_EXPR_RE.match(expression)
+        if match:
+            return MathematicalEngine.calculate(match.group(2), float(match.group(1)), float(match.group(3)))
+        
         try:
             # Simple and safe evaluation for basic operations
             if '+' in expression:
@@ -176,22 +292,23 @@ class ResponseProcessor:
     
     @staticmethod
     def extract_result_from_response(response_text: str) -> Optional[float]:
-        """Extract numerical result from AI response."""
-        # Look for patterns like "result is X", "answer: X", etc.
-        patterns = [
-            r'(?:result|answer|equals?|is)\s*:?\s*(-?\d+\.?\d*)',
-            r'(-?\d+\.?\d*)\s*(?:is the result|is the answer)',
-            r'final answer\s*:?\s*(-?\d+\.?\d*)',
-            r'(-?\d+\.?\d*)$'  # Last number in response
-        ]
+        """Extract numerical result from AI response.
         
-        for pattern in patterns:
-            match = re.search(pattern, response_text, re.IGNORECASE)
-            if match:
-                try:
-                    return float(match.group(1))
-                except ValueError:
-                    continue
+        >>> ResponseProcessor.extract_result_from_response("Final answer: 8, since 3 is 5")
+        8.0
+        >>> ResponseProcessor.extract_result_from_response("final answer: 8\\nThis 7")
+        8.0
+        """
+        # Keep the first match of the highest-priority pattern
+        best = None
+        for match in _RESULT_RE.finditer(response_text.lower()):
+            if best is None or match.lastindex < best.lastindex:
+                best = match
+                if best.lastindex == 1:
+                    break
+        
+        if best is not None:
+            return float(best.group(best.lastindex))
         
         # Fallback: extract any numbers
         numbers = MathematicalEngine.extract_numbers_from_text(response_text)
@@ -200,23 +317,173 @@ class ResponseProcessor:
         
         return None
     
+    @staticmethod
+    def extract_output_text(response_body: Dict[str, Any]) -> str:
+        """Extract the output text from a raw Responses API body, e.g. a Batch API output line."""
+        return "".join(
+            part.get("text", "")
+            for item in response_body.get("output", [])
+            if item.get("type") == "message"
+            for part in item.get("content", [])
+            if part.get("type") == "output_text"
+        )
+    
     @staticmethod
     def extract_reasoning(response_text: str) -> str:
         """Extract reasoning steps from AI response."""
-        # Look for reasoning patterns
-        reasoning_patterns = [
-            r'(?:step|reasoning|explanation|because|since)[^:]*:\s*(.*?)(?:\n|$)',
-            r'(?:i think|i believe|i calculate)[^:]*:\s*(.*?)(?:\n|$)'
-        ]
-        
-        for pattern in reasoning_patterns:
-            match = re.search(pattern, response_text, re.IGNORECASE)
+        # Match on lowercased text, but return the original casing for display
+        text = response_text.lower()
+        for pattern in _REASONING_PATTERNS:
+            match = pattern.search(text)
             if match:
-                return match.group(1).strip()
+                # A few non-ASCII characters change length when lowercased; only
+                # then do the offsets not line up with the original text
+                source = response_text if len(text) == len(response_text) else text
+                start, end = match.span(1)
+                return source[start:end].strip()
         
         return response_text.strip()
 
 
+class ResponseCache:
+    """Two-tier cache of AI responses: an in-memory LRU backed by SQLite on disk."""
+    
+    def __init__(self, db_path: str = "ai_math_cache.db", max_entries: int = 1000, ttl_seconds: float = 7 * 24 * 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._db = sqlite3.connect(db_path)
+        self._db.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, response TEXT, ts REAL)")
+        # Drop expired entries once at startup rather than on every lookup
+        self._db.execute("DELETE FROM cache WHERE ts < ?", (time.time() - self.ttl_seconds,))
+        self._db.commit()
+    
+    @staticmethod
+    def make_key(expression: str, numbers: List[float]) -> str:
+        """Build the cache key for an expression and its numbers."""
+        return hashlib.sha256(f"{expression}|{tuple(numbers)}".encode()).hexdigest()
+    
+    def get(self, key: str) -> Optional[str]:
+        """Return a cached response, or None on a miss or expired entry."""
+        now = time.time()
+        
+        entry = self._memory.get(key)
+        if entry is not None:
+            response, ts = entry
+            if now - ts <= self.ttl_seconds:
+                self._memory.move_to_end(key)
+                return response
+            del self._memory[key]
+        
+        row = self._db.execute("SELECT response, ts FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        
+        response, ts = row
+        if now - ts > self.ttl_seconds:
+            self._db.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self._db.commit()
+            return None
+        
+        self._remember(key, response, ts)
+        return response
+    
+    def put(self, key: str, response: str):
+        """Store a response in both tiers."""
+        ts = time.time()
+        self._db.execute("INSERT OR REPLACE INTO cache (key, response, ts) VALUES (?, ?, ?)", (key, response, ts))
+        self._db.commit()
+        self._remember(key, response, ts)
+    
+    def _remember(self, key: str, response: str, ts: float):
+        """Insert into the in-memory tier, evicting the least recently used entry."""
+        self._memory[key] = (response, ts)
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+    
+    def close(self):
+        """Close the SQLite connection."""
+        self._db.close()
+
+
+class SemanticCache:
+    """Embedding-similarity cache that catches rephrasings the exact cache misses.
+    
+    Optional: if sentence-transformers is missing or the model fails to load, the
+    cache disables itself and callers fall back to the exact cache alone.
+    """
+    
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2", threshold: float = 0.92, max_entries: int = 1000):
+        self.model_name = model_name
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.enabled = True
+        self._model = None
+        # embed runs in worker threads; only one of them loads the model
+        self._model_lock = threading.Lock()
+        # Rows are L2-normalized so a single matmul yields cosine similarities
+        self._embeddings: Optional[np.ndarray] = None
+        self._signatures: List[Tuple] = []
+        self._responses: List[str] = []
+    
+    @staticmethod
+    def make_signature(expression: str, numbers: List[float]) -> Tuple:
+        """Operands and operator symbols that a cached entry must match exactly.
+        
+        Embeddings barely distinguish "5 * 3" from "5 / 3" or "5 + 3" from "5 + 4",
+        so similarity alone must never decide between different calculations.
+        """
+        operators = tuple(sorted(set(_OPERATOR_SYMBOL_RE.findall(expression))))
+        return tuple(numbers), operators
+    
+    def embed(self, text: str) -> Optional[np.ndarray]:
+        """Return the normalized embedding of text, loading the model on first use.
+        
+        Blocking (model load and inference): call it off the event loop. Returns None
+        once the cache has been disabled.
+        """
+        with self._model_lock:
+            if self._model is None and self.enabled:
+                try:
+                    # Imported lazily: sentence-transformers pulls in torch
+                    from sentence_transformers import SentenceTransformer
+                    self._model = SentenceTransformer(self.model_name)
+                except Exception as e:
+                    logger.warning(f"Semantic cache disabled, could not load {self.model_name}: {e}")
+                    self.enabled = False
+            if self._model is None:
+                return None
+        return self._model.encode(text, normalize_embeddings=True).astype(np.float32)
+    
+    def lookup(self, embedding: np.ndarray, signature: Tuple) -> Optional[str]:
+        """Return the most similar cached response with a matching signature, if close enough."""
+        if self._embeddings is None:
+            return None
+        
+        sims = self._embeddings @ embedding
+        mask = np.fromiter((sig == signature for sig in self._signatures), dtype=bool, count=len(self._signatures))
+        if not mask.any():
+            return None
+        sims[~mask] = -np.inf
+        idx = int(np.argmax(sims))
+        if sims[idx] >= self.threshold:
+            return self._responses[idx]
+        return None
+    
+    def add(self, embedding: np.ndarray, signature: Tuple, response: str):
+        """Add a response, evicting the oldest entry when full."""
+        row = embedding[np.newaxis, :]
+        self._embeddings = row if self._embeddings is None else np.vstack([self._embeddings, row])
+        self._signatures.append(signature)
+        self._responses.append(response)
+        
+        if len(self._responses) > self.max_entries:
+            self._embeddings = self._embeddings[1:]
+            del self._signatures[0]
+            del self._responses[0]
+
+
 class ErrorHandler:
     """Handles errors and recovery strategies."""
     
@@ -259,6 +526,10 @@ class AIMathAgent:
         self.math_engine = MathematicalEngine()
         self.response_processor = ResponseProcessor()
         self.error_handler = ErrorHandler()
+        self.response_cache = ResponseCache()
+        self.semantic_cache = SemanticCache()
+        # Load the tokenizer up front rather than blocking the first request on it
+        _get_encoding()
         
         demo_mode=os.getenv('DEMO_MODE')
         print(f"{Fore.GREEN}Demo Mode for Authentication is: {demo_mode}{Style.RESET_ALL}")
@@ -274,24 +545,31 @@ class AIMathAgent:
               INF_URL="https://inference.generativeai.us-chicago-1.oci.oraclecloud.com/20231130/actions/v1"
               print(f"{Fore.GREEN}API Key is : {api_key}{Style.RESET_ALL}")
               print(f"{Fore.GREEN}Inference URL is : {api_key}{Style.RESET_ALL}")
-              self.client = OpenAI(api_key=api_key,base_url=INF_URL)
+              # Async client with a shared keep-alive pool so requests don't stall the event loop
+              self.client = AsyncOpenAI(
+                  api_key=api_key,
+                  base_url=INF_URL,
+                  http_client=httpx.AsyncClient(
+                      limits=httpx.Limits(max_keepalive_connections=20, max_connections=100)
+                  ),
+              )
         elif (demo_mode == 'IP'):
 
-          self.client = OciOpenAI(
+          self.client = AsyncOciOpenAI(
                      region="us-chicago-1",
                      auth=OciInstancePrincipalAuth(),
                      compartment_id="ocid1.compartment.oc1..aaaaaaaamjxynn55q2nddbeur3zwnkzis4yogjtqkd6zzyxxx",
                   )
         elif (demo_mode == 'SP'):
 
-          self.client = OciOpenAI(
+          self.client = AsyncOciOpenAI(
                      region="us-chicago-1",
                      auth=OciSessionAuth(profile_name="gendemo"),
                      compartment_id="ocid1.compartment.oc1..aaaaaaaamjxynn55q2nddbeur3zwnkzis4yogjtqkd6zzyxxx",
                   )
         else:
 
-          self.client = OciOpenAI(
+          self.client = AsyncOciOpenAI(
                      region="us-chicago-1",
                      auth=OciUserPrincipalAuth(profile_name="DEFAULT"),
                      compartment_id="ocid1.compartment.oc1..aaaaaaaamjxynn55q2nddbeur3zwnkzis4yogjtqkd6zzyxxx",
@@ -300,18 +578,37 @@ class AIMathAgent:
         print(f"{Fore.GREEN}End of Auth Details Display{Style.RESET_ALL}")
         print(self.client)
         self.total_tokens_used = 0
-        self.calculation_history: List[CalculationResult] = []
+        # Calculation history stored column-wise (one array per CalculationResult
+        # field) so stats and export scan contiguous columns
+        self._hist = {
+            'expression': [],
+            'result': array('d'),
+            'reasoning': [],
+            'confidence': array('d'),
+            'verification_passed': bytearray(),
+            'timestamp_ns': array('q'),
+            'tokens_used': array('i'),
+        }
+        # Running totals over the history so stats are O(1)
+        self._sum_tokens: int = 0
+        self._sum_conf: float = 0.0
+        self._n_verified: int = 0
         
         logger.info("AI Math Agent initialized successfully")
     
-    async def process_request(self, user_input: str) -> CalculationResult:
-        """Process a user request for mathematical operation."""
+    async def process_request(self, user_input: str, use_context: bool = True) -> CalculationResult:
+        """Process a user request for mathematical operation.
+        
+        With use_context=False the request is independent: no conversation context
+        is sent and neither message is recorded in the conversation.
+        """
         self.state = AgentState.PROCESSING
         logger.info(f"Processing request: {user_input}")
         
         try:
             # Add user message to conversation
-            self.conversation_manager.add_message("user", user_input)
+            if use_context:
+                self.conversation_manager.add_message("user", user_input)
             
             # Parse the mathematical expression
             expression, numbers = self.math_engine.parse_math_expression(user_input)
@@ -323,43 +620,23 @@ class AIMathAgent:
             
             # Get AI reasoning and calculation
             self.state = AgentState.REASONING
-            ai_response = await self._get_ai_calculation(expression, numbers)
-            
-            # Extract result and reasoning
-            result = self.response_processor.extract_result_from_response(ai_response)
-            reasoning = self.response_processor.extract_reasoning(ai_response)
+            ai_response, source, embedding = await self._get_ai_calculation(expression, numbers, use_context)
             
-            if result is None:
-                raise ValueError("Could not extract result from AI response")
-            
-            # Verify result locally
-            self.state = AgentState.VERIFYING
-            local_result = self.math_engine.calculate_locally(expression)
-            verification_passed = local_result is not None and abs(result - local_result) < 0.0001
-            
-            # Calculate confidence
-            confidence = self.error_handler.calculate_confidence(result, local_result)
-            
-            # Create result object
-            calculation_result = CalculationResult(
-                expression=expression,
-                result=result,
-                reasoning=reasoning,
-                confidence=confidence,
-                verification_passed=verification_passed,
-                timestamp=datetime.now(),
-                tokens_used=self._estimate_tokens_used(ai_response)
+            calculation_result, local_result = self._build_calculation_result(
+                expression, ai_response, from_api=(source == "api")
             )
             
-            # Add to history
-            self.calculation_history.append(calculation_result)
+            # Only responses that yielded a result are worth answering from the cache
+            if source != "cache":
+                self._cache_response(expression, numbers, ai_response, embedding)
             
             # Add assistant response to conversation
-            response_text = self._format_response(calculation_result, local_result)
-            self.conversation_manager.add_message("assistant", response_text)
+            if use_context:
+                response_text = self._format_response(calculation_result, local_result)
+                self.conversation_manager.add_message("assistant", response_text)
             
             self.state = AgentState.COMPLETED
-            logger.info(f"Calculation completed: {expression} = {result}")
+            logger.info(f"Calculation completed: {expression} = {calculation_result.result}")
             
             return calculation_result
             
@@ -369,42 +646,217 @@ class AIMathAgent:
             logger.error(f"Error processing request: {error_msg}")
             raise ValueError(error_msg)
     
-    async def _get_ai_calculation(self, expression: str, numbers: List[float]) -> str:
-        """Get calculation from OpenAI with reasoning."""
-        context = self.conversation_manager.get_context()
+    def _build_calculation_result(self, expression: str, ai_response: str, from_api: bool = True) -> Tuple[CalculationResult, Optional[float]]:
+        """Extract, verify and record the result of an AI response; returns it with the local result.
         
-        system_prompt = """You are a mathematical AI assistant specialized in arithmetic operations. 
-        When given a mathematical expression, you must:
-        1. Show step-by-step reasoning
-        2. Perform the calculation accurately
-        3. Provide the final numerical result clearly
-        4. Be concise but thorough in your explanation
+        Responses served from a cache (from_api=False) cost no tokens and record 0.
+        """
+        # Extract result and reasoning
+        result = self.response_processor.extract_result_from_response(ai_response)
+        reasoning = self.response_processor.extract_reasoning(ai_response)
         
-        Format your response to include the reasoning process and end with the numerical result."""
+        if result is None:
+            raise ValueError("Could not extract result from AI response")
         
-        user_prompt = f"""Please calculate this expression and show your reasoning: {expression}
+        # Verify result locally
+        self.state = AgentState.VERIFYING
+        local_result = self.math_engine.calculate_locally(expression)
+        verification_passed = local_result is not None and abs(result - local_result) < 0.0001
         
-        Numbers involved: {numbers}
+        # Calculate confidence
+        confidence = self.error_handler.calculate_confidence(result, local_result)
         
-        Provide step-by-step reasoning and give the final result."""
+        # Create result object
+        calculation_result = CalculationResult(
+            expression=expression,
+            result=result,
+            reasoning=reasoning,
+            confidence=confidence,
+            verification_passed=verification_passed,
+            timestamp_ns=time.time_ns(),
+            tokens_used=self._estimate_tokens_used(ai_response) if from_api else 0
+        )
         
-        # Build messages for API call
-        messages = [{"role": "system", "content": system_prompt}]
-        messages.extend(context[-5:])  # Include last 5 messages for context
-        messages.append({"role": "user", "content": user_prompt})
+        # Add to history
+        self._append_history(calculation_result)
         
-        response = self.client.responses.create(
-            model="openai.gpt-oss-120b",
+        return calculation_result, local_result
+    
+    async def process_batch(self, inputs: List[str], max_concurrency: int = 8) -> List[Union[CalculationResult, Exception]]:
+        """Process several requests concurrently, overlapping their API round-trips.
+        
+        A semaphore bounds in-flight requests to respect provider rate limits. Failed
+        requests are returned as exceptions in place rather than aborting the batch.
+        Requests are independent, as in process_batch_offline: no conversation context
+        is sent or recorded, since interleaved items would otherwise see each other's
+        messages. self.state reflects whichever item changed state last.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def run(user_input: str) -> CalculationResult:
+            async with semaphore:
+                return await self.process_request(user_input, use_context=False)
+        
+        logger.info(f"Processing batch of {len(inputs)} requests (max concurrency {max_concurrency})")
+        return await asyncio.gather(*(run(user_input) for user_input in inputs), return_exceptions=True)
+    
+    async def process_batch_offline(self, inputs: List[str], poll_interval: float = 60.0) -> List[Union[CalculationResult, Exception]]:
+        """Process a large batch through the OpenAI Batch API.
+        
+        Results arrive within a 24h completion window at roughly half the cost of the
+        synchronous endpoint, so this suits offline scoring rather than interactive use.
+        Requests are independent: no conversation context is sent or recorded.
+        """
+        results: List[Optional[Union[CalculationResult, Exception]]] = [None] * len(inputs)
+        parsed: Dict[int, Tuple[str, List[float]]] = {}
+        lines = []
+        
+        for i, user_input in enumerate(inputs):
+            expression, numbers = self.math_engine.parse_math_expression(user_input)
+            if len(numbers) < 2:
+                results[i] = ValueError("Please provide at least two numbers for calculation")
+                continue
+            parsed[i] = (expression, numbers)
+            lines.append(json.dumps({
+                "custom_id": str(i),
+                "method": "POST",
+                "url": "/v1/responses",
+                "body": {"model": MODEL_ID, "input": self._build_messages(expression, numbers, []), "store": False},
+            }))
+        
+        if lines:
+            batch_file = await self.client.files.create(
+                file=("batch_input.jsonl", "\n".join(lines).encode("utf-8")),
+                purpose="batch",
+            )
+            batch = await self.client.batches.create(
+                input_file_id=batch_file.id,
+                endpoint="/v1/responses",
+                completion_window="24h",
+            )
+            logger.info(f"Submitted batch {batch.id} with {len(lines)} requests")
+            
+            while batch.status not in ("completed", "failed", "expired", "cancelled"):
+                await asyncio.sleep(poll_interval)
+                batch = await self.client.batches.retrieve(batch.id)
+            
+            if batch.status != "completed" or not batch.output_file_id:
+                raise ValueError(f"Batch {batch.id} ended with status {batch.status}")
+            
+            output = await self.client.files.content(batch.output_file_id)
+            for line in output.text.splitlines():
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                i = int(item["custom_id"])
+                expression, numbers = parsed[i]
+                try:
+                    response = item.get("response") or {}
+                    if item.get("error") or response.get("status_code") != 200:
+                        raise ValueError(f"Batch request failed: {item.get('error') or response.get('body')}")
+                    ai_response = self.response_processor.extract_output_text(response["body"])
+                    results[i], _ = self._build_calculation_result(expression, ai_response)
+                    self._cache_response(expression, numbers, ai_response)
+                except Exception as e:
+                    results[i] = e
+            
+            logger.info(f"Batch {batch.id} completed")
+        
+        return [ValueError("No result returned by batch job") if r is None else r for r in results]
+    
+    def _build_messages(self, expression: str, numbers: List[float], context: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """Build the Responses API input messages for a calculation."""
+        # Static instructions first, request-specific values strictly at the tail
+        user_prompt = (
+            "Please calculate this expression, provide step-by-step reasoning and give the final result.\n"
+            f"Expression: {expression}\n"
+            f"Numbers involved: {numbers}"
+        )
+        
+        # Build messages for API call: system prompt, last 5 messages for context, request
+        return [_SYSTEM_MESSAGE, *context[-5:], {"role": "user", "content": user_prompt}]
+    
+    async def _get_ai_calculation(self, expression: str, numbers: List[float], use_context: bool = True) -> Tuple[str, str, Optional[np.ndarray]]:
+        """Get calculation from OpenAI with reasoning.
+        
+        Returns the response text, where it came from ("cache", "semantic" or "api")
+        and, for API responses, the expression embedding to store it under. Nothing
+        is cached here; see _cache_response.
+        """
+        # Identical calculations are answered from the cache without a round-trip
+        cache_key = self.response_cache.make_key(expression, numbers)
+        cached_response = self.response_cache.get(cache_key)
+        if cached_response is not None:
+            logger.info(f"Cache hit for: {expression}")
+            return cached_response, "cache", None
+        
+        # Rephrasings of an earlier calculation are answered by embedding similarity;
+        # the embedding is computed in a worker thread to keep the event loop free
+        embedding = None
+        if self.semantic_cache.enabled:
+            embedding = await asyncio.to_thread(self.semantic_cache.embed, expression)
+        if embedding is not None:
+            signature = self.semantic_cache.make_signature(expression, numbers)
+            cached_response = self.semantic_cache.lookup(embedding, signature)
+            if cached_response is not None:
+                logger.info(f"Semantic cache hit for: {expression}")
+                return cached_response, "semantic", None
+        
+        context = self.conversation_manager.get_context() if use_context else []
+        messages = self._build_messages(expression, numbers, context)
+        
+        stream = await self.client.responses.create(
+            model=MODEL_ID,
             input=messages,
             #max_tokens=300,
             #temperature=0.1  # Low temperature for consistent math
-            stream=False,
+            stream=True,
             store=False,
         )
-        #print(response.output_text.strip())
         
-        #return response.choices[0].message.content
-        return response.output_text
+        # Parse while tokens arrive and stop once the final answer is unambiguous.
+        # The context manager closes the response on every exit, including the
+        # early break and errors, so its pooled connection is released at once.
+        text = ""
+        async with stream:
+            async for event in stream:
+                if event.type in ("response.failed", "response.incomplete", "error"):
+                    # Never hand a partial answer on as if it were complete
+                    raise ValueError(f"Response stream ended with {event.type}: {self._stream_error_detail(event)}")
+                if event.type != "response.output_text.delta":
+                    continue
+                # Only rescan the tail that may contain a newly completed match
+                search_from = max(len(text) - 64, 0)
+                text += event.delta
+                if _FINAL_ANSWER_RE.search(text, search_from):
+                    logger.info("Final answer received, closing stream early")
+                    break
+        
+        if not text.strip():
+            raise ValueError("Empty response from AI model")
+        return text, "api", embedding
+    
+    @staticmethod
+    def _stream_error_detail(event: Any) -> str:
+        """Best-effort reason for a failed, incomplete or error stream event."""
+        if event.type == "error":
+            return getattr(event, "message", None) or "unknown error"
+        response = getattr(event, "response", None)
+        error = getattr(response, "error", None)
+        if error is not None:
+            return getattr(error, "message", None) or str(error)
+        details = getattr(response, "incomplete_details", None)
+        if details is not None:
+            return getattr(details, "reason", None) or str(details)
+        return "no details"
+    
+    def _cache_response(self, expression: str, numbers: List[float], response: str, embedding: Optional[np.ndarray] = None):
+        """Cache a response that produced a result; the embedding also stores it semantically."""
+        if not response.strip():
+            return
+        self.response_cache.put(self.response_cache.make_key(expression, numbers), response)
+        if embedding is not None:
+            self.semantic_cache.add(embedding, self.semantic_cache.make_signature(expression, numbers), response)
     
     def _format_response(self, result: CalculationResult, local_result: Optional[float]) -> str:
         """Format the response for display."""
@@ -418,29 +870,82 @@ class AIMathAgent:
         return response
     
     def _estimate_tokens_used(self, response_text: str) -> int:
-        """Estimate tokens used in response."""
-        # Rough estimation: ~4 characters per token
-        return len(response_text) // 4
+        """Count tokens used in response."""
+        encoding = _get_encoding()
+        if encoding is None:
+            return len(response_text) // 4
+        # encode_ordinary: model text may contain strings like "<|endoftext|>",
+        # which encode() rejects as disallowed special tokens
+        return len(encoding.encode_ordinary(response_text))
+    
+    async def close(self):
+        """Close the underlying HTTP client and its connection pool."""
+        await self.client.close()
+        self.response_cache.close()
+        logger.info("AI Math Agent client closed")
+    
+    def _append_history(self, result: CalculationResult):
+        """Append a result to the history columns and running totals."""
+        for name, column in self._hist.items():
+            column.append(getattr(result, name))
+        self._sum_tokens += result.tokens_used
+        self._sum_conf += result.confidence
+        self._n_verified += int(result.verification_passed)
+    
+    def history_length(self) -> int:
+        """Number of calculations in the history."""
+        return len(self._hist['result'])
+    
+    def recent_history(self, count: int) -> List[CalculationResult]:
+        """The last ``count`` calculations, rebuilt as CalculationResult objects."""
+        start = max(self.history_length() - count, 0)
+        h = self._hist
+        return [
+            CalculationResult(
+                expression=h['expression'][i],
+                result=h['result'][i],
+                reasoning=h['reasoning'][i],
+                confidence=h['confidence'][i],
+                verification_passed=bool(h['verification_passed'][i]),
+                timestamp_ns=h['timestamp_ns'][i],
+                tokens_used=h['tokens_used'][i],
+            )
+            for i in range(start, self.history_length())
+        ]
+    
+    @property
+    def calculation_history(self) -> List[CalculationResult]:
+        """Full calculation history as CalculationResult objects (built on demand)."""
+        return self.recent_history(self.history_length())
     
     def get_session_stats(self) -> Dict[str, Any]:
         """Get session statistics."""
+        total = self.history_length()
         return {
-            "total_calculations": len(self.calculation_history),
-            "total_tokens_used": sum(r.tokens_used for r in self.calculation_history),
-            "average_confidence": sum(r.confidence for r in self.calculation_history) / len(self.calculation_history) if self.calculation_history else 0,
-            "verification_rate": sum(1 for r in self.calculation_history if r.verification_passed) / len(self.calculation_history) if self.calculation_history else 0,
+            "total_calculations": total,
+            "total_tokens_used": self._sum_tokens,
+            "average_confidence": self._sum_conf / total if total else 0,
+            "verification_rate": self._n_verified / total if total else 0,
             "current_state": self.state.value
         }
     
     def export_history(self, filename: str):
         """Export calculation history to file."""
-        history_data = [asdict(result) for result in self.calculation_history]
-        # Convert datetime objects to strings for JSON serialization
-        for item in history_data:
-            item['timestamp'] = item['timestamp'].isoformat()
+        # Convert columns to JSON-friendly values; timestamps become datetimes only
+        # here and keep their "timestamp" key in the file
+        columns = {}
+        for name, column in self._hist.items():
+            if name == 'verification_passed':
+                column = [bool(v) for v in column]
+            elif name == 'timestamp_ns':
+                name, column = 'timestamp', [_ns_to_datetime(ns) for ns in column]
+            columns[name] = column
+        names = list(columns)
+        history_data = [dict(zip(names, row)) for row in zip(*columns.values())]
         
-        with open(filename, 'w') as f:
-            json.dump(history_data, f, indent=2)
+        # orjson writes the naive local timestamps as ISO strings directly
+        with open(filename, 'wb') as f:
+            f.write(orjson.dumps(history_data, option=orjson.OPT_INDENT_2))
         
         logger.info(f"History exported to {filename}")
 
@@ -448,6 +953,16 @@ class AIMathAgent:
 class InteractiveInterface:
     """Interactive command-line interface for the AI Math Agent."""
     
+    # Colored line templates, built once instead of per printed line
+    _CYAN_FMT = Fore.CYAN + "{}" + Style.RESET_ALL
+    _GREEN_FMT = Fore.GREEN + "{}" + Style.RESET_ALL
+    _YELLOW_FMT = Fore.YELLOW + "{}" + Style.RESET_ALL
+    _RED_FMT = Fore.RED + "{}" + Style.RESET_ALL
+    _HISTORY_FMT = (
+        Fore.GREEN + "{}. {} = {}" + Style.RESET_ALL + "\n"
+        + "   " + Fore.YELLOW + "Confidence: {:.1%} | Verified: {}" + Style.RESET_ALL + "\n"
+    )
+    
     def __init__(self, agent: AIMathAgent):
         self.agent = agent
         self.running = True
@@ -537,45 +1052,56 @@ class InteractiveInterface:
     
     def display_result(self, result: CalculationResult):
         """Display calculation result with formatting."""
-        print(f"\n{Fore.CYAN}🧮 Calculation Result:{Style.RESET_ALL}")
-        print(f"{Fore.GREEN}Expression: {result.expression}{Style.RESET_ALL}")
-        print(f"{Fore.GREEN}Result: {result.result}{Style.RESET_ALL}")
-        print(f"{Fore.YELLOW}Reasoning: {result.reasoning}{Style.RESET_ALL}")
-        
         # Confidence indicator
-        confidence_color = Fore.GREEN if result.confidence >= 0.8 else Fore.YELLOW if result.confidence >= 0.5 else Fore.RED
-        print(f"{confidence_color}Confidence: {result.confidence:.1%}{Style.RESET_ALL}")
+        confidence_fmt = self._GREEN_FMT if result.confidence >= 0.8 else self._YELLOW_FMT if result.confidence >= 0.5 else self._RED_FMT
         
         # Verification status
         if result.verification_passed:
-            print(f"{Fore.GREEN}✅ Verification: Passed{Style.RESET_ALL}")
+            verification = self._GREEN_FMT.format("✅ Verification: Passed")
         else:
-            print(f"{Fore.RED}⚠️  Verification: Failed{Style.RESET_ALL}")
+            verification = self._RED_FMT.format("⚠️  Verification: Failed")
+        
+        print("\n".join([
+            "\n" + self._CYAN_FMT.format("🧮 Calculation Result:"),
+            self._GREEN_FMT.format(f"Expression: {result.expression}"),
+            self._GREEN_FMT.format(f"Result: {result.result}"),
+            self._YELLOW_FMT.format(f"Reasoning: {result.reasoning}"),
+            confidence_fmt.format(f"Confidence: {result.confidence:.1%}"),
+            verification,
+        ]))
     
     def display_stats(self):
         """Display session statistics."""
         stats = self.agent.get_session_stats()
-        print(f"\n{Fore.CYAN}📊 Session Statistics:{Style.RESET_ALL}")
-        print(f"{Fore.GREEN}Total Calculations: {stats['total_calculations']}{Style.RESET_ALL}")
-        print(f"{Fore.GREEN}Total Tokens Used: {stats['total_tokens_used']}{Style.RESET_ALL}")
-        print(f"{Fore.GREEN}Average Confidence: {stats['average_confidence']:.1%}{Style.RESET_ALL}")
-        print(f"{Fore.GREEN}Verification Rate: {stats['verification_rate']:.1%}{Style.RESET_ALL}")
-        print(f"{Fore.GREEN}Current State: {stats['current_state']}{Style.RESET_ALL}")
+        print("\n".join([
+            "\n" + self._CYAN_FMT.format("📊 Session Statistics:"),
+            self._GREEN_FMT.format(f"Total Calculations: {stats['total_calculations']}"),
+            self._GREEN_FMT.format(f"Total Tokens Used: {stats['total_tokens_used']}"),
+            self._GREEN_FMT.format(f"Average Confidence: {stats['average_confidence']:.1%}"),
+            self._GREEN_FMT.format(f"Verification Rate: {stats['verification_rate']:.1%}"),
+            self._GREEN_FMT.format(f"Current State: {stats['current_state']}"),
+        ]))
     
     def display_history(self):
         """Display calculation history."""
-        if not self.agent.calculation_history:
-            print(f"{Fore.YELLOW}No calculation history yet.{Style.RESET_ALL}")
+        if not self.agent.history_length():
+            print(self._YELLOW_FMT.format("No calculation history yet."))
             return
         
-        print(f"\n{Fore.CYAN}📜 Calculation History:{Style.RESET_ALL}")
-        for i, result in enumerate(self.agent.calculation_history[-5:], 1):  # Show last 5
-            print(f"{Fore.GREEN}{i}. {result.expression} = {result.result}{Style.RESET_ALL}")
-            print(f"   {Fore.YELLOW}Confidence: {result.confidence:.1%} | Verified: {'✅' if result.verification_passed else '❌'}{Style.RESET_ALL}")
+        # Build the whole listing and write it in one call
+        lines = ["\n" + self._CYAN_FMT.format("📜 Calculation History:") + "\n"]
+        for i, result in enumerate(self.agent.recent_history(5), 1):  # Show last 5
+            lines.append(self._HISTORY_FMT.format(
+                i, result.expression, result.result,
+                result.confidence, '✅' if result.verification_passed else '❌'
+            ))
+        sys.stdout.write("".join(lines))
+        sys.stdout.flush()
 
 
 async def main():
     """Main function to run the AI Math Agent."""
+    agent = None
     try:
         # Initialize agent
         agent = AIMathAgent()
@@ -592,6 +1118,9 @@ async def main():
         print(f"{Fore.RED}❌ Unexpected error: {e}{Style.RESET_ALL}")
         logger.error(f"Fatal error in main: {e}")
         sys.exit(1)
+    finally:
+        if agent is not None:
+            await agent.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+One-time conversion of the GiftRecords Excel sheet to Parquet.
+gemini_process_excel.py reads the Parquet file, which loads far faster than xlsx.
+"""
+
+import argparse
+import pandas as pd
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert an Excel sheet to a Parquet file"
+    )
+    parser.add_argument(
+        "--input",
+        default="demodata.xlsx",
+        help="Path to the Excel file (default: demodata.xlsx)"
+    )
+    parser.add_argument(
+        "--sheet",
+        default="GiftRecords",
+        help="Sheet name to convert (default: GiftRecords)"
+    )
+    parser.add_argument(
+        "--output",
+        default="demodata.parquet",
+        help="Path of the Parquet file to write (default: demodata.parquet)"
+    )
+
+    args = parser.parse_args()
+
+    df = pd.read_excel(args.input, sheet_name=args.sheet)
+    df.to_parquet(args.output)
+    print(f"Wrote {len(df)} rows to {args.output}")
+
+
+if __name__ == "__main__":
+    main()